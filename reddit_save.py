@@ -1,18 +1,25 @@
 #!/usr/bin/env python
 
 import argparse
+import glob
+import json
 import os
 import re
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from functools import lru_cache
 from pathlib import Path
 
 import praw
 import requests
 import yt_dlp
+from praw.models import Comment, Submission
 from redvid import Downloader
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException, Timeout
 from tqdm import tqdm
+from urllib3.util.retry import Retry
 
 from logindata import (REDDIT_PASSWORD, REDDIT_USERNAME, client_id,
                        client_secret)
@@ -24,6 +31,36 @@ PLATFORMS = {'youtube.com', 'vimeo.com', 'dailymotion.com', 'redgifs.com',
              'gfycat.com', 'imgur.com'}
 MAX_FILENAME_LENGTH = 160
 REQUEST_TIMEOUT = 10
+DOWNLOAD_WORKERS = 8
+CHUNK_SIZE = 1 << 16
+GFYCAT_PAGE_LIMIT = 50000
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Compiled patterns
+_NON_WORD = re.compile(r'[^\w\s-]')
+_MULTI_SEP = re.compile(r'[-_]+')
+_GFYCAT = re.compile(rb"http([\dA-Za-z\+\:\/\.]+)\.mp4")
+_IMGUR_OG_MEDIA = re.compile(r'<meta property="og:(?:image|video)" content="([^"]+)"')
+_ID_ATTR = re.compile(rb'id="(.+?)"')
+_ITEM_BLOCKS = {
+    item_class: re.compile(
+        rf'(<div class="{item_class}"[\S\n\t\v ]+?<!--{item_class}end--><\/div>)'.encode()
+    )
+    for item_class in ("post", "comment")
+}
+
+
+class _SafeDict(dict):
+    """Template fields that render as empty when not supplied."""
+    
+    def __missing__(self, key):
+        return ""
+
+
+@lru_cache(maxsize=4096)
+def _format_day(epoch_day):
+    """Format a UTC day number, shared by everything posted that day."""
+    return datetime.fromtimestamp(epoch_day * 86400, tz=timezone.utc).strftime("%d %B, %Y")
 
 
 class RedditArchiver:
@@ -31,8 +68,16 @@ class RedditArchiver:
     def __init__(self, location):
         self.location = Path(location)
         self.client = self._make_client()
-        self._html_cache = {}
+        self._me = self.client.user.me()
+        self._worker_state = threading.local()
+        self._http = self._make_session()
+        self._imgur_cache = {}
         self._setup_directories()
+        self._media_index = self._index_media()
+        
+        # Inline assets are identical on every page, so wrap them once
+        self._style_block = f"<style>\n{self._read_template('style.css')}\n</style>"
+        self._script_block = f"<script>\n{self._read_template('main.js')}\n</script>"
     
     @staticmethod
     def _make_client():
@@ -45,6 +90,20 @@ class RedditArchiver:
             password=REDDIT_PASSWORD
         )
     
+    @staticmethod
+    def _make_session():
+        """Creates a pooled HTTP session shared by all media downloads."""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=64,
+            max_retries=Retry(total=2, backoff_factor=0.3)
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({"User-Agent": "reddit-saver"})
+        return session
+    
     def _setup_directories(self):
         """Create necessary directories if they don't exist."""
         (self.location / "media").mkdir(parents=True, exist_ok=True)
@@ -56,46 +115,61 @@ class RedditArchiver:
         template_path = Path("html") / template_name
         return template_path.read_text(encoding="utf-8")
     
-    def get_posts(self, mode):
-        """Get saved or upvoted posts."""
-        user = self.client.user.me()
-        source = user.saved(limit=None) if mode == "saved" else user.upvoted(limit=None)
-        return [item for item in source if item.__class__.__name__ == "Submission"]
-    
-    def get_comments(self, mode):
-        """Get saved comments (only for saved mode)."""
-        if mode != "saved":
-            return []
-        return [item for item in self.client.user.me().saved(limit=None)
-                if item.__class__.__name__ != "Submission"]
+    def iter_items(self, mode):
+        """Yield saved or upvoted posts, and saved comments, as the listing pages in."""
+        source = self._me.saved(limit=None) if mode == "saved" else self._me.upvoted(limit=None)
+        for item in source:
+            if isinstance(item, Submission):
+                yield item
+            elif isinstance(item, Comment) and mode == "saved":
+                yield item
     
     def _replace_html_placeholders(self, html, replacements):
-        """Replace multiple placeholders in HTML efficiently."""
-        for placeholder, value in replacements.items():
-            html = html.replace(placeholder, str(value))
-        return html
+        """Fill the {field} placeholders of a template in a single pass."""
+        return html.format_map(_SafeDict(replacements))
     
-    def get_post_html(self, post):
-        """Generate HTML for a post."""
+    def get_post_html(self, post, media=None, page=False):
+        """Generate HTML for a post, for the archive or its own page."""
         template = self._read_template("post-div.html")
-        dt = datetime.utcfromtimestamp(post.created_utc)
+        dt = datetime.fromtimestamp(post.created_utc, tz=timezone.utc)
         
         replacements = {
-            "<!--title-->": post.title,
-            "<!--subreddit-->": f"/r/{post.subreddit}",
-            "<!--user-->": f"/u/{post.author.name}" if post.author else "[deleted]",
-            "<!--link-->": f"posts/{post.id}.html",
-            "<!--reddit-link-->": f"https://reddit.com{post.permalink}",
-            "<!--content-link-->": post.url,
-            "<!--id-->": post.id,
-            "<!--body-->": (post.selftext_html or "").replace(
-                '<a href="/r/', '<a href="https://reddit.com/r/'),
-            "<!--timestamp-->": str(dt),
-            "<!--date-->": dt.strftime("%d %B, %Y")
+            "heading": "h1" if page else "h2",
+            "title": post.title,
+            "subreddit": f"/r/{post.subreddit}",
+            "user": f"/u/{post.author.name}" if post.author else "[deleted]",
+            "page_link": "" if page else f'<a href="posts/{post.id}.html">Link</a>',
+            "reddit_link": f"https://reddit.com{post.permalink}",
+            "content_link": post.url,
+            "id": post.id,
+            "body": self._absolutize_links(post.selftext_html),
+            "timestamp": f"{dt:%Y-%m-%d %H:%M:%S}",
+            "date": _format_day(int(post.created_utc) // 86400),
+            "preview": self.get_media_preview_html(
+                media, "../media" if page else "media") if media else ""
         }
         
         return self._replace_html_placeholders(template, replacements)
     
+    @staticmethod
+    def _absolutize_links(body_html):
+        """Point relative subreddit links in Reddit-rendered HTML at reddit.com."""
+        return (body_html or "").replace('<a href="/r/', '<a href="https://reddit.com/r/')
+    
+    def _index_media(self):
+        """Map post IDs to media files already downloaded for them.
+        
+        Downloads only appear under their final name once complete, so
+        in-progress files (.part and the like) are never picked up.
+        """
+        media_index = {}
+        with os.scandir(self.location / "media") as entries:
+            for entry in entries:
+                stem, _, extension = entry.name.rpartition(".")
+                if "_" in stem and extension in IMAGE_EXTENSIONS | VIDEO_EXTENSIONS:
+                    media_index[stem.rsplit("_", 1)[1]] = entry.name
+        return media_index
+    
     def save_media(self, post):
         """Download media associated with a post."""
         url = post.url
@@ -104,6 +178,19 @@ class RedditArchiver:
         if url.endswith(post.permalink):
             return None
         
+        # Reuse a download left by an earlier, interrupted run
+        if post.id in self._media_index:
+            return self._media_index[post.id]
+        
+        media = self._download_media(post)
+        if media:
+            self._media_index[post.id] = media
+        return media
+    
+    def _download_media(self, post):
+        """Pick a download strategy for a post's linked media and run it."""
+        url = post.url
+        
         stripped_url = url.split("?")[0]
         extension = stripped_url.split(".")[-1].lower()
         domain = ".".join(url.split("/")[2].split(".")[-2:])
@@ -139,46 +226,73 @@ class RedditArchiver:
     
     def _download_direct_media(self, post, readable_name, extension):
         """Download media directly from URL."""
-        filename = f"{readable_name}_{post.id}.{extension}"
         try:
-            response = requests.get(post.url, timeout=REQUEST_TIMEOUT)
-            media_type = response.headers.get("Content-Type", "")
-            
-            if media_type.startswith(("image", "video")):
-                (self.location / "media" / filename).write_bytes(response.content)
-                return filename
+            return self._download_file(post.url, f"{readable_name}_{post.id}", extension)
         except (RequestException, Timeout) as e:
             print(f"Direct download failed: {e}")
         
         return None
     
+    def _download_file(self, url, stem, extension=None):
+        """Stream an image or video into the media folder, returning its filename.
+        
+        Without an explicit extension it is taken from the Content-Type.
+        """
+        with self._http.get(url, timeout=REQUEST_TIMEOUT, stream=True) as response:
+            media_type = response.headers.get("Content-Type", "")
+            if response.status_code != 200 or not media_type.startswith(("image", "video")):
+                return None
+            
+            extension = extension or media_type.split(";")[0].split("/")[-1]
+            filename = f"{stem}.{extension}"
+            path = self.location / "media" / filename
+            
+            # Stream into a .part file so an interrupted download never
+            # leaves a truncated file under the final name
+            part_path = path.with_name(f"{filename}.part")
+            try:
+                with open(part_path, "wb") as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                os.replace(part_path, path)
+            except BaseException:
+                part_path.unlink(missing_ok=True)
+                raise
+            return filename
+    
     def _download_vreddit(self, url, readable_name, post_id):
         """Download v.redd.it video."""
-        downloader = Downloader(max_q=True, log=False)
-        downloader.url = url
-        current_dir = os.getcwd()
+        # Have redvid write straight into the media folder under our name,
+        # so nothing needs moving between directories or filesystems
+        path = self.location / "media" / f"{readable_name}_{post_id}.mp4"
+        downloader = Downloader(url=url, path=str(path.parent), filename=path.stem,
+                                max_q=True, log=False)
         
         try:
-            downloaded_name = downloader.download()
-            extension = downloaded_name.split(".")[-1]
-            filename = f"{readable_name}_{post_id}.{extension}"
-            
-            os.rename(downloaded_name, self.location / "media" / filename)
-            return filename
-        except Exception as e:
+            downloader.download()
+            if path.exists():
+                return path.name
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except BaseException as e:
+            # redvid reports failures by raising bare BaseException
             print(f"v.redd.it download failed: {e}")
-            os.chdir(current_dir)
         
         return None
     
     def _resolve_gfycat_url(self, url):
         """Resolve gfycat URL to direct video link."""
         try:
-            response = requests.get(url, timeout=REQUEST_TIMEOUT)
-            if len(response.content) < 50000:
-                match = re.search(r"http([\dA-Za-z\+\:\/\.]+)\.mp4", response.text)
-                if match:
-                    return match.group()
+            with self._http.get(url, timeout=REQUEST_TIMEOUT, stream=True) as response:
+                # Only small pages are searched, so stop reading once past the limit
+                content = b""
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    content += chunk
+                    if len(content) >= GFYCAT_PAGE_LIMIT:
+                        return None
+            match = _GFYCAT.search(content)
+            if match:
+                return match.group().decode()
         except (RequestException, Timeout) as e:
             print(f"Gfycat resolution failed: {e}")
         
@@ -186,94 +300,143 @@ class RedditArchiver:
     
     def _download_imgur(self, url, readable_name, post_id):
         """Download imgur image."""
-        base_url = url[url.find("//") + 2:]
-        base_url = base_url.replace("i.imgur.com", "imgur.com")
-        base_url = base_url.replace("m.imgur.com", "imgur.com")
+        image_hash = url.split("?")[0].rstrip("/").split("/")[-1].split(".")[0]
+        if image_hash not in self._imgur_cache:
+            self._imgur_cache[image_hash] = self._resolve_imgur_url(image_hash)
         
-        for ext in IMAGE_EXTENSIONS:
-            direct_url = f"https://i.{base_url}.{ext}"
-            try:
-                response = requests.get(direct_url, timeout=REQUEST_TIMEOUT)
-                if response.status_code == 200:
-                    filename = f"{readable_name}_{post_id}.{ext}"
-                    (self.location / "media" / filename).write_bytes(response.content)
-                    return filename
-            except (RequestException, Timeout):
-                continue
+        direct_url = self._imgur_cache[image_hash]
+        if not direct_url:
+            return None
+        
+        try:
+            return self._download_file(direct_url, f"{readable_name}_{post_id}")
+        except (RequestException, Timeout) as e:
+            print(f"Imgur download failed: {e}")
+        
+        return None
+    
+    def _resolve_imgur_url(self, image_hash):
+        """Resolve imgur hash to direct media link."""
+        try:
+            # imgur serves the image whatever extension is asked for, and
+            # redirects missing images to a "removed" placeholder
+            response = self._http.head(f"https://i.imgur.com/{image_hash}.jpg",
+                                       allow_redirects=True, timeout=REQUEST_TIMEOUT)
+            media_type = response.headers.get("Content-Type", "")
+            if response.ok and media_type.startswith("image/") and "removed" not in response.url:
+                return response.url
+            
+            # Fall back to the media URL advertised on the imgur page
+            response = self._http.get(f"https://imgur.com/{image_hash}", timeout=REQUEST_TIMEOUT)
+            match = _IMGUR_OG_MEDIA.search(response.text)
+            if match:
+                return match.group(1)
+        except (RequestException, Timeout) as e:
+            print(f"Imgur resolution failed: {e}")
         
         return None
     
     def _download_with_ytdlp(self, url, readable_name, post_id):
         """Download media using yt-dlp."""
+        stem = f"{readable_name}_{post_id}"
+        finished = []
+        
+        def record_finished(progress):
+            if progress["status"] == "finished":
+                finished.append(Path(progress["filename"]))
+        
         options = {
             "nocheckcertificate": True,
             "quiet": True,
             "no_warnings": True,
             "ignoreerrors": True,
-            "outtmpl": str(self.location / "media" / f"{readable_name}_{post_id}.%(ext)s"),
-            "timeout": REQUEST_TIMEOUT
+            "outtmpl": str(self.location / "media" / f"{stem}.%(ext)s"),
+            "timeout": REQUEST_TIMEOUT,
+            "progress_hooks": [record_finished]
         }
         
         try:
             with yt_dlp.YoutubeDL(options) as ydl:
                 ydl.download([url])
             
-            # Find the downloaded file
-            for file in (self.location / "media").iterdir():
-                if file.name.startswith(f"{readable_name}_{post_id}"):
-                    return file.name
+            # The hook names the downloaded file, unless separate formats
+            # were merged into a new one afterwards
+            if finished and finished[-1].exists():
+                return finished[-1].name
+            
+            match = next((self.location / "media").glob(f"{glob.escape(stem)}.*"), None)
+            if match:
+                return match.name
         except Exception as e:
             print(f"yt-dlp download failed: {e}")
         
         return None
     
-    def add_media_preview_to_html(self, post_html, media):
-        """Add media preview to post HTML."""
+    def get_media_preview_html(self, media, media_dir="media"):
+        """Generate preview HTML for a downloaded media file."""
         extension = media.split(".")[-1]
-        location = f"media/{media}"
+        location = f"{media_dir}/{media}"
         
         if extension in IMAGE_EXTENSIONS:
-            preview = f'<img src="{location}">'
-        elif extension in VIDEO_EXTENSIONS:
-            preview = f'<video controls><source src="{location}"></video>'
-        else:
-            return post_html
-        
-        return post_html.replace("<!--preview-->", preview)
+            return f'<img src="{location}">'
+        if extension in VIDEO_EXTENSIONS:
+            return f'<video controls><source src="{location}"></video>'
+        return ""
     
-    def create_post_page_html(self, post, post_html):
+    def _worker_client(self):
+        """Return this thread's own PRAW client, creating it on first use.
+        
+        PRAW is not thread-safe, so self.client stays with the main thread
+        and each download worker talks to Reddit through its own instance.
+        """
+        client = getattr(self._worker_state, "client", None)
+        if client is None:
+            client = self._worker_state.client = self._make_client()
+        return client
+    
+    def _fetch_comments(self, post):
+        """Fetch a post's top-level comments, dropping "load more" stubs."""
+        # Runs on a worker thread, so load the post through that thread's client
+        submission = self._worker_client().submission(id=post.id)
+        submission.comments.replace_more(limit=0)
+        return list(submission.comments)
+    
+    def create_post_page_html(self, post, media, comments):
         """Create full HTML page for a post."""
         template = self._read_template("post.html")
-        style = self._read_template("style.css")
-        script = self._read_template("main.js")
-        
-        # Adjust paths and tags for individual post page
-        adjusted_html = post_html.replace("h2>", "h1>")
-        adjusted_html = adjusted_html.replace('<img src="media/', '<img src="../media/')
-        adjusted_html = adjusted_html.replace('<source src="media/', '<source src="../media/')
-        adjusted_html = re.sub(r'<a href="posts.+?</a>', "", adjusted_html)
         
-        # Get comments
-        post.comments.replace_more(limit=0)
         comments_html = [
             self.get_comment_html(comment, op=post.author.name if post.author else None)
-            for comment in post.comments
+            for comment in comments
         ]
         
         replacements = {
-            "<!--title-->": post.title,
-            "<!--post-->": adjusted_html,
-            "<style></style>": f"<style>\n{style}\n</style>",
-            "<script></script>": f"<script>\n{script}\n</script>",
-            "<!--comments-->": "\n".join(comments_html)
+            "title": post.title,
+            "post": self.get_post_html(post, media, page=True),
+            "style": self._style_block,
+            "script": self._script_block,
+            "comments": "\n".join(comments_html)
         }
         
         return self._replace_html_placeholders(template, replacements)
     
     def get_comment_html(self, comment, children=True, op=None):
-        """Generate HTML for a comment."""
+        """Generate HTML for a comment and, optionally, its immediate replies."""
         template = self._read_template("comment-div.html")
-        dt = datetime.utcfromtimestamp(comment.created_utc)
+        replacements = self._get_comment_fields(comment, op)
+        
+        # Replies are only rendered one level deep, so a flat loop suffices
+        if children:
+            replacements["children"] = "\n".join(
+                self._replace_html_placeholders(template, self._get_comment_fields(child, op))
+                for child in comment.replies
+            )
+        
+        return self._replace_html_placeholders(template, replacements)
+    
+    def _get_comment_fields(self, comment, op):
+        """Build the template fields for a single comment."""
+        dt = datetime.fromtimestamp(comment.created_utc, tz=timezone.utc)
         
         # Format author display
         if comment.author:
@@ -283,45 +446,102 @@ class RedditArchiver:
         else:
             author = "[deleted]"
         
-        replacements = {
-            "<!--user-->": author,
-            "<!--body-->": (comment.body_html or "").replace(
-                '<a href="/r/', '<a href="https://reddit.com/r/'),
-            "<!--score-->": str(comment.score),
-            "<!--link-->": f"https://reddit.com{comment.permalink}",
-            "<!--timestamp-->": str(dt),
-            "<!--id-->": comment.id,
-            "<!--date-->": dt.strftime("%H:%M - %d %B, %Y")
+        return {
+            "user": author,
+            "body": self._absolutize_links(comment.body_html),
+            "score": str(comment.score),
+            "link": f"https://reddit.com{comment.permalink}",
+            "timestamp": f"{dt:%Y-%m-%d %H:%M:%S}",
+            "id": comment.id,
+            "date": f"{dt:%H:%M} - {_format_day(int(comment.created_utc) // 86400)}"
         }
-        
-        html = self._replace_html_placeholders(template, replacements)
-        
-        # Add child comments
-        if children:
-            children_html = [
-                self.get_comment_html(child, children=False, op=op)
-                for child in comment.replies
-            ]
-            html = html.replace("<!--children-->", "\n".join(children_html))
-        
-        return html
     
     def _get_existing_items(self, html_file, item_class):
         """Extract existing post/comment IDs and HTML from archive."""
         file_path = self.location / html_file
         
         if not file_path.exists():
-            return [], []
-        
-        content = file_path.read_text(encoding="utf-8")
-        ids = re.findall(r'id="(.+?)"', content)
-        items_html = re.findall(
-            rf'(<div class="{item_class}"[\S\n\t\v ]+?<!--{item_class}end--><\/div>)',
-            content
-        )
+            return set(), []
+        
+        # Use the index written alongside the archive when it is up to date
+        index = self._load_index(file_path)
+        if index is not None:
+            section = f"{item_class}s"
+            ids = set(index[section])
+            if section not in index["spans"]:
+                return ids, []
+            start, end = index["spans"][section]
+            with open(file_path, "rb") as f:
+                f.seek(start)
+                items_html = f.read(end - start).decode("utf-8")
+            return ids, [items_html] if items_html else []
+        
+        # Scan the raw bytes and only decode the matches
+        content = file_path.read_bytes()
+        ids = {item_id.decode("utf-8") for item_id in _ID_ATTR.findall(content)}
+        items_html = [
+            item.decode("utf-8") for item in _ITEM_BLOCKS[item_class].findall(content)
+        ]
         
         return ids, items_html
     
+    @staticmethod
+    def _write_atomic(path, data):
+        """Write a file through a temporary sibling so it is never left half-written."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    
+    @staticmethod
+    def _index_path(file_path):
+        """Path of the ID index kept alongside an archive file."""
+        return file_path.with_suffix(".index.json")
+    
+    def _load_index(self, file_path):
+        """Load an archive's ID index, or None if missing or stale."""
+        try:
+            index = json.loads(self._index_path(file_path).read_bytes())
+            stat = file_path.stat()
+            if index["size"] == stat.st_size and index["mtime_ns"] == stat.st_mtime_ns:
+                return index
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+    
+    def _save_index(self, file_path, post_ids, comment_ids, spans):
+        """Record archived IDs and section byte offsets for the next run."""
+        stat = file_path.stat()
+        index = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "posts": sorted(post_ids),
+            "comments": sorted(comment_ids),
+            "spans": spans
+        }
+        self._write_atomic(self._index_path(file_path), json.dumps(index))
+    
+    def _render_archive_html(self, template, replacements, sections):
+        """Render an archive page to bytes, with the byte span of each section."""
+        markers = {name: f"\0{name}\0" for name in sections}
+        skeleton = self._replace_html_placeholders(template, {**replacements, **markers})
+        
+        # Pieces alternate between template text and section names
+        chunks, spans, offset = [], {}, 0
+        for i, piece in enumerate(skeleton.split("\0")):
+            chunk = (sections[piece] if i % 2 else piece).encode("utf-8")
+            if i % 2:
+                spans[piece] = [offset, offset + len(chunk)]
+            chunks.append(chunk)
+            offset += len(chunk)
+        
+        return b"".join(chunks), spans
+    
     def _sanitize_filename(self, subreddit, title):
         """Create a sanitized filename from subreddit and title."""
         # Combine subreddit and title
@@ -329,13 +549,13 @@ class RedditArchiver:
         
         # Remove invalid characters for Windows/Unix
         # Keep only alphanumeric, spaces, hyphens, and underscores
-        filename = re.sub(r'[^\w\s-]', '', filename)
+        filename = _NON_WORD.sub('', filename)
         
         # Replace spaces with underscores
         filename = filename.replace(' ', '_')
         
         # Replace multiple underscores/hyphens with single ones
-        filename = re.sub(r'[-_]+', '_', filename)
+        filename = _MULTI_SEP.sub('_', filename)
         
         # Remove leading/trailing underscores, hyphens, or periods
         filename = filename.strip('_-.')
@@ -359,6 +579,27 @@ class RedditArchiver:
         
         return filename
     
+    def _process_post(self, post, media, comments_future, existing_pages):
+        """Render a post, write its individual page and return its HTML."""
+        post_html = self.get_post_html(post, media)
+        
+        # Create individual post page
+        try:
+            page_html = self.create_post_page_html(post, media, comments_future.result())
+            postfile = self._sanitize_filename(str(post.subreddit), post.title)
+            
+            # If filename collision, append post ID
+            if f"{postfile}.html" in existing_pages:
+                postfile = f"{postfile}_{post.id}"
+            existing_pages.add(f"{postfile}.html")
+            
+            self._write_atomic(self.location / "posts" / f"{postfile}.html", page_html)
+        except Exception as e:
+            print(f"Failed to create post page for '{post.title}': {e}")
+            # Continue processing other posts
+        
+        return post_html
+    
     def archive(self, mode):
         """Main archiving function."""
         html_file = f"{mode}.html"
@@ -367,47 +608,43 @@ class RedditArchiver:
         existing_post_ids, existing_posts_html = self._get_existing_items(html_file, "post")
         existing_comment_ids, existing_comments_html = self._get_existing_items(html_file, "comment")
         
-        # Process new posts
-        all_posts = self.get_posts(mode)
-        new_posts = [p for p in all_posts if p.id not in existing_post_ids]
-        posts_html = []
-        
-        if new_posts:
-            print(f"Processing {len(new_posts)} new posts...")
-            for post in tqdm(new_posts):
-                post_html = self.get_post_html(post)
-                
-                # Download and add media
-                media = self.save_media(post)
-                if media:
-                    post_html = self.add_media_preview_to_html(post_html, media)
-                
-                posts_html.append(post_html)
+        # Media downloads and comment fetches are network-bound, so each new
+        # post's are started as soon as the listing yields it, overlapping
+        # them with fetching the rest of the listing
+        jobs, new_comments, posts_html = [], [], []
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            try:
+                for item in self.iter_items(mode):
+                    if isinstance(item, Submission):
+                        if item.id not in existing_post_ids:
+                            jobs.append((item, executor.submit(self.save_media, item),
+                                         executor.submit(self._fetch_comments, item)))
+                    elif item.id not in existing_comment_ids:
+                        new_comments.append(item)
                 
-                # Create individual post page
-                try:
-                    page_html = self.create_post_page_html(post, post_html)
-                    postfile = self._sanitize_filename(str(post.subreddit), post.title)
-                    post_path = self.location / "posts" / f"{postfile}.html"
+                # Process new posts in listing order, each once its own jobs are done
+                if jobs:
+                    print(f"Processing {len(jobs)} new posts...")
+                    # List the post pages once rather than stat-ing each new filename
+                    with os.scandir(self.location / "posts") as entries:
+                        existing_pages = {entry.name for entry in entries}
                     
-                    # Check if file already exists
-                    if not post_path.exists():
-                        post_path.write_text(page_html, encoding="utf-8")
-                    else:
-                        # If filename collision, append post ID
-                        post_path = self.location / "posts" / f"{postfile}_{post.id}.html"
-                        post_path.write_text(page_html, encoding="utf-8")
-                except Exception as e:
-                    print(f"Failed to create post page for '{post.title}': {e}")
-                    # Continue processing other posts
-        else:
-            print("No new posts")
+                    for post, download, comments in tqdm(jobs):
+                        posts_html.append(self._process_post(
+                            post, download.result(), comments, existing_pages))
+                else:
+                    print("No new posts")
+            except BaseException:
+                # Leaving the block waits for every queued job, so drop the
+                # ones that haven't started rather than hang on the backlog
+                for _, download, comments in jobs:
+                    download.cancel()
+                    comments.cancel()
+                raise
         
         posts_html.extend(existing_posts_html)
         
         # Process new comments
-        all_comments = self.get_comments(mode)
-        new_comments = [c for c in all_comments if c.id not in existing_comment_ids]
         comments_html = []
         
         if new_comments:
@@ -421,18 +658,24 @@ class RedditArchiver:
         
         # Generate final HTML
         template = self._read_template(html_file)
-        style = self._read_template("style.css")
-        script = self._read_template("main.js")
-        
-        final_html = self._replace_html_placeholders(template, {
-            "<style></style>": f"<style>\n{style}\n</style>",
-            "<script></script>": f"<script>\n{script}\n</script>",
-            "<!--posts-->": "\n".join(posts_html),
-            "<!--comments-->": "\n".join(comments_html)
+        
+        final_html, spans = self._render_archive_html(template, {
+            "style": self._style_block,
+            "script": self._script_block
+        }, {
+            "posts": "\n".join(posts_html),
+            "comments": "\n".join(comments_html)
         })
         
-        (self.location / html_file).write_text(final_html, encoding="utf-8")
-        print(f"Archive saved to {self.location / html_file}")
+        file_path = self.location / html_file
+        self._write_atomic(file_path, final_html)
+        self._save_index(
+            file_path,
+            existing_post_ids | {post.id for post, _, _ in jobs},
+            existing_comment_ids | {comment.id for comment in new_comments},
+            spans
+        )
+        print(f"Archive saved to {file_path}")
 
 
 def main():